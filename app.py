@@ -1,24 +1,115 @@
 from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from ariadne import QueryType, MutationType, gql, make_executable_schema
+from ariadne import QueryType, MutationType, ObjectType, gql, make_executable_schema
 from ariadne.asgi import GraphQL
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from ariadne.asgi.handlers import GraphQLHTTPHandler
+from aiodataloader import DataLoader
+from cachetools import TTLCache
+import asyncio
+import asyncpg
+import itertools
+import json
 import logging
+import orjson
+import os
+import pytest
+import re
+from datetime import datetime
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
 
-# Database connection
-def get_db_connection():
-    return psycopg2.connect(
-        dbname="ecommerce", user="admin", password="password", host="postgres", port="5432",
-        cursor_factory=RealDictCursor
+# Database connection settings
+DB_SETTINGS = {
+    "database": os.getenv("DATABASE_NAME", "ecommerce"),
+    "user": os.getenv("DATABASE_USER", "admin"),
+    "password": os.getenv("DATABASE_PASSWORD", "password"),
+    "host": os.getenv("DATABASE_HOST", "postgres"),
+    "port": os.getenv("DATABASE_PORT", "5432"),
+}
+
+# Channel the ETL notifies after loading new data (and updateProduct after renaming a product);
+# every worker listens on it and clears its analytics cache
+ETL_LOADED_CHANNEL = "etl_loaded"
+
+
+# Database connection pool (created once at startup, see create_db_pool).
+# Size it so max_size * uvicorn workers stays below Postgres max_connections.
+async def create_pool():
+    return await asyncpg.create_pool(
+        **DB_SETTINGS,
+        min_size=int(os.getenv("DATABASE_POOL_MIN_SIZE", "4")),
+        max_size=int(os.getenv("DATABASE_POOL_MAX_SIZE", "32")),
+        init=init_connection
     )
 
 
+# Resolvers build their JSON in Postgres; decode it straight into Python lists/dicts
+async def init_connection(conn):
+    await conn.set_type_codec("json", encoder=json.dumps, decoder=orjson.loads, schema="pg_catalog")
+
+
+def get_pool(info):
+    return info.context["request"].app.state.pool
+
+
+# asyncpg binds typed parameters, so date strings from GraphQL are parsed up front. Like Postgres' own
+# casts, any ISO date or timestamp is accepted: UTC offsets are dropped (the columns are timestamp
+# without time zone) and dates keep only the day.
+def parse_timestamp(value):
+    return datetime.fromisoformat(value).replace(tzinfo=None) if value else None
+
+
+def parse_date(value):
+    return parse_timestamp(value).date() if value else None
+
+
+# Analytics results only change when the ETL runs, so they are cached across requests.
+# Entries expire after a minute and the whole cache is dropped when the ETL notifies us.
+analytics_cache = TTLCache(maxsize=1024, ttl=60)
+analytics_cache_locks = {}
+
+
+async def cached(key, load):
+    result = analytics_cache.get(key)
+    if result is not None:
+        return result
+    # One lock per key so concurrent misses run the query once instead of stampeding the DB
+    lock = analytics_cache_locks.setdefault(key, asyncio.Lock())
+    try:
+        async with lock:
+            result = analytics_cache.get(key)
+            if result is None:
+                result = await load()
+                analytics_cache[key] = result
+    finally:
+        # Also when load() fails, or every distinct failing argument set would leak a lock
+        analytics_cache_locks.pop(key, None)
+    return result
+
+
+def invalidate_analytics_cache(*args):
+    logger.info("Clearing analytics cache")
+    analytics_cache.clear()
+
+
+# Batches every category lookup made while resolving one request into a single query
+class CategoryLoader(DataLoader):
+    def __init__(self, pool):
+        super().__init__()
+        self.pool = pool
+
+    async def batch_load_fn(self, category_ids):
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT category_id, name FROM product_categories WHERE category_id = ANY($1)", category_ids)
+        categories = {r["category_id"]: {"category_id": r["category_id"], "name": r["name"]} for r in rows}
+        return [categories.get(category_id) for category_id in category_ids]
+
+
 # Load GraphQL schema
 with open("schema.graphql", "r") as f:
     type_defs = gql(f.read())
@@ -26,211 +117,321 @@ with open("schema.graphql", "r") as f:
 # Define query and mutation resolvers
 query = QueryType()
 mutation = MutationType()
-
-
-@query.field("productSales")
-def resolve_product_sales(_, info, startDate, endDate, productId=None, categoryId=None,
-                          limit=10, offset=0, sortBy="order_date", sortOrder="ASC"):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    query = """
+product = ObjectType("Product")
+
+# Every resolver's SQL comes from a small, finite set of variants (optional filters x sort
+# column x sort order). They are all rendered here at import time so requests only do a dict
+# lookup, and each variant is one stable statement for asyncpg's per-connection prepared
+# statement cache (and hence Postgres' plan cache).
+SORT_ORDERS = ["ASC", "DESC"]
+ORDER_SORT_COLUMNS = ["order_date", "total_amount"]
+PRODUCT_SUMMARY_SORT_COLUMNS = ["total_units_sold", "total_revenue", "order_count"]
+
+PRODUCT_SALES_QUERY = """
+    SELECT COALESCE(json_agg(json_build_object(
+        'order_id', s.order_id,
+        'customer_id', s.customer_id,
+        'order_date', to_char(s.order_date, 'YYYY-MM-DD"T"HH24:MI:SS'),
+        'total_amount', s.total_amount::float8
+    )), '[]')
+    FROM (
         SELECT o.order_id, o.customer_id, o.order_date, o.total_amount
         FROM orders o
         JOIN order_items oi ON o.order_id = oi.order_id
         JOIN products p ON oi.product_id = p.product_id
-        WHERE o.order_date BETWEEN %s AND %s
+        WHERE o.order_date BETWEEN $1 AND $2
         AND o.status NOT IN ('Cancelled', 'Returned')
         {product_filter}
         {category_filter}
         ORDER BY {sort_by} {sort_order}
-        LIMIT %s OFFSET %s
-    """
-    filters = []
-    params = [startDate, endDate]
-    if productId:
-        filters.append("oi.product_id = %s")
-        params.append(productId)
-    if categoryId:
-        filters.append("p.category_id = %s")
-        params.append(categoryId)
+        LIMIT ${limit_param} OFFSET ${offset_param}
+    ) s
+"""
+
 
-    query = query.format(
+def build_product_sales_sql(has_product, has_category, sort_by, sort_order):
+    filters = []
+    param_count = 2
+    if has_product:
+        param_count += 1
+        filters.append(f"oi.product_id = ${param_count}")
+    if has_category:
+        param_count += 1
+        filters.append(f"p.category_id = ${param_count}")
+    return PRODUCT_SALES_QUERY.format(
         product_filter="AND " + " AND ".join(filters) if filters else "",
         category_filter="",
-        sort_by=f"o.{sortBy}" if sortBy in ["order_date", "total_amount"] else "o.order_date",
-        sort_order=sortOrder if sortOrder in ["ASC", "DESC"] else "ASC"
+        sort_by=f"o.{sort_by}",
+        sort_order=sort_order,
+        limit_param=param_count + 1,
+        offset_param=param_count + 2
     )
-    cursor.execute(query, params + [limit, offset])
-    results = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return [{"order_id": r["order_id"], "customer_id": r["customer_id"],
-             "order_date": r["order_date"].isoformat(), "total_amount": float(r["total_amount"])}
-            for r in results]
 
 
-@query.field("customerPurchaseHistory")
-def resolve_customer_purchase_history(_, info, customerId, startDate=None, endDate=None,
-                                      limit=10, offset=0, sortBy="order_date", sortOrder="DESC"):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    query = """
+PRODUCT_SALES_SQL = {
+    key: build_product_sales_sql(*key)
+    for key in itertools.product([False, True], [False, True], ORDER_SORT_COLUMNS, SORT_ORDERS)
+}
+
+CUSTOMER_PURCHASE_HISTORY_QUERY = """
+    SELECT COALESCE(json_agg(json_build_object(
+        'order_id', s.order_id,
+        'customer_id', s.customer_id,
+        'order_date', to_char(s.order_date, 'YYYY-MM-DD"T"HH24:MI:SS'),
+        'total_amount', s.total_amount::float8
+    )), '[]')
+    FROM (
         SELECT order_id, customer_id, order_date, total_amount
         FROM orders
-        WHERE customer_id = %s
+        WHERE customer_id = $1
         AND status NOT IN ('Cancelled', 'Returned')
         {date_filter}
         ORDER BY {sort_by} {sort_order}
-        LIMIT %s OFFSET %s
-    """
-    params = [customerId]
-    filters = []
-    if startDate:
-        filters.append("order_date >= %s")
-        params.append(startDate)
-    if endDate:
-        filters.append("order_date <= %s")
-        params.append(endDate)
+        LIMIT ${limit_param} OFFSET ${offset_param}
+    ) s
+"""
 
-    query = query.format(
+
+def build_customer_purchase_history_sql(has_start, has_end, sort_by, sort_order):
+    filters = []
+    param_count = 1
+    if has_start:
+        param_count += 1
+        filters.append(f"order_date >= ${param_count}")
+    if has_end:
+        param_count += 1
+        filters.append(f"order_date <= ${param_count}")
+    return CUSTOMER_PURCHASE_HISTORY_QUERY.format(
         date_filter="AND " + " AND ".join(filters) if filters else "",
-        sort_by=f"{sortBy}" if sortBy in ["order_date", "total_amount"] else "order_date",
-        sort_order=sortOrder if sortOrder in ["ASC", "DESC"] else "DESC"
+        sort_by=sort_by,
+        sort_order=sort_order,
+        limit_param=param_count + 1,
+        offset_param=param_count + 2
     )
-    cursor.execute(query, params + [limit, offset])
-    results = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return [{"order_id": r["order_id"], "customer_id": r["customer_id"],
-             "order_date": r["order_date"].isoformat(), "total_amount": float(r["total_amount"])}
-            for r in results]
 
 
-@query.field("topSellingProductsByCategory")
-def resolve_top_selling_products(_, info, categoryId, startDate=None, endDate=None,
-                                 limit=10, sortBy="total_units_sold", sortOrder="DESC"):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    query = """
+CUSTOMER_PURCHASE_HISTORY_SQL = {
+    key: build_customer_purchase_history_sql(*key)
+    for key in itertools.product([False, True], [False, True], ORDER_SORT_COLUMNS, SORT_ORDERS)
+}
+
+# The view stores ids only; names are joined live after the top rows are picked, so a renamed product
+# shows its new name straight away
+TOP_SELLING_PRODUCTS_QUERY = """
+    SELECT COALESCE(json_agg(json_build_object(
+        'product_id', s.product_id,
+        'product_name', p.name,
+        'category_name', pc.name,
+        'total_units_sold', s.total_units_sold,
+        'total_revenue', s.total_revenue::float8,
+        'order_count', s.order_count
+    ) ORDER BY s.{sort_by} {sort_order}), '[]')
+    FROM (
         SELECT 
-            p.product_id, 
-            p.name AS product_name, 
-            pc.name AS category_name, 
-            SUM(oi.quantity) AS total_units_sold,
-            SUM(oi.total) AS total_revenue,
-            COUNT(DISTINCT o.order_id) AS order_count
-        FROM products p
-        JOIN product_categories pc ON p.category_id = pc.category_id
-        JOIN order_items oi ON p.product_id = oi.product_id
-        JOIN orders o ON oi.order_id = o.order_id
-        WHERE pc.category_id = %s
-        AND o.status NOT IN ('Cancelled', 'Returned')
+            product_id, 
+            category_id, 
+            SUM(units_sold)::bigint AS total_units_sold,
+            SUM(revenue) AS total_revenue,
+            SUM(order_count)::bigint AS order_count
+        FROM product_category_sales_mv
+        WHERE category_id = $1
         {date_filter}
-        GROUP BY p.product_id, p.name, pc.name
+        GROUP BY product_id, category_id
         ORDER BY {sort_by} {sort_order}
-        LIMIT %s
-    """
-    params = [categoryId]
-    filters = []
-    if startDate:
-        filters.append("o.order_date >= %s")
-        params.append(startDate)
-    if endDate:
-        filters.append("o.order_date <= %s")
-        params.append(endDate)
+        LIMIT ${limit_param}
+    ) s
+    JOIN products p ON p.product_id = s.product_id
+    JOIN product_categories pc ON pc.category_id = s.category_id
+"""
 
-    query = query.format(
+
+def build_top_selling_products_sql(has_start, has_end, sort_by, sort_order):
+    filters = []
+    param_count = 1
+    if has_start:
+        param_count += 1
+        filters.append(f"day >= ${param_count}")
+    if has_end:
+        param_count += 1
+        filters.append(f"day <= ${param_count}")
+    return TOP_SELLING_PRODUCTS_QUERY.format(
         date_filter="AND " + " AND ".join(filters) if filters else "",
-        sort_by=sortBy if sortBy in ["total_units_sold", "total_revenue", "order_count"] else "total_units_sold",
-        sort_order=sortOrder if sortOrder in ["ASC", "DESC"] else "DESC"
+        sort_by=sort_by,
+        sort_order=sort_order,
+        limit_param=param_count + 1
     )
-    cursor.execute(query, params + [limit])
-    results = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return [{"product_id": r["product_id"], "product_name": r["product_name"],
-             "category_name": r["category_name"], "total_units_sold": r["total_units_sold"],
-             "total_revenue": float(r["total_revenue"]), "order_count": r["order_count"]}
-            for r in results]
 
 
-@query.field("salesTrends")
-def resolve_sales_trends(_, info, startDate, endDate, interval="day"):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    interval_map = {"day": "day", "week": "week", "month": "month"}
-    trunc_interval = interval_map.get(interval, "day")
-    query = f"""
+TOP_SELLING_PRODUCTS_SQL = {
+    key: build_top_selling_products_sql(*key)
+    for key in itertools.product([False, True], [False, True], PRODUCT_SUMMARY_SORT_COLUMNS, SORT_ORDERS)
+}
+
+# Range predicates on the raw order_date keep idx_orders_order_date_active usable
+# (wrapping order_date in DATE() to join dim_time forced a full scan)
+SALES_TRENDS_SQL = """
+    SELECT COALESCE(json_agg(json_build_object(
+        'date', to_char(s.date::timestamptz, 'YYYY-MM-DD"T"HH24:MI:SSTZH:TZM'),
+        'total_sales', s.total_sales::float8
+    )), '[]')
+    FROM (
         SELECT 
-            DATE_TRUNC(%s, dt.date) AS date,
+            DATE_TRUNC($1, o.order_date) AS date,
             SUM(oi.total) AS total_sales
-        FROM dim_time dt
-        JOIN orders o ON DATE(o.order_date) = dt.date
+        FROM orders o
         JOIN order_items oi ON o.order_id = oi.order_id
-        WHERE dt.date BETWEEN %s AND %s
+        WHERE o.order_date >= $2::date AND o.order_date < $3::date + 1
         AND o.status NOT IN ('Cancelled', 'Returned')
-        GROUP BY DATE_TRUNC(%s, dt.date)
-        ORDER BY DATE_TRUNC(%s, dt.date)
-    """
-    cursor.execute(query, (trunc_interval, startDate, endDate, trunc_interval, trunc_interval))
-    results = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return [{"date": r["date"].isoformat(), "total_sales": float(r["total_sales"])} for r in results]
+        GROUP BY 1
+        ORDER BY 1
+    ) s
+"""
+
+# Update and category join in one round trip
+UPDATE_PRODUCT_QUERY = """
+    WITH u AS (
+        UPDATE products 
+        SET {updates}, updated_at = NOW()
+        WHERE product_id = ${product_param}
+        RETURNING product_id, name, price, category_id
+    )
+    SELECT u.product_id, u.name, u.price, pc.category_id, pc.name AS category_name
+    FROM u
+    JOIN product_categories pc ON pc.category_id = u.category_id
+"""
 
 
-@mutation.field("updateProduct")
-def resolve_update_product(_, info, productId, name=None, price=None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def build_update_product_sql(has_name, has_price):
     updates = []
+    if has_name:
+        updates.append(f"name = ${len(updates) + 1}")
+    if has_price:
+        updates.append(f"price = ${len(updates) + 1}")
+    return UPDATE_PRODUCT_QUERY.format(updates=", ".join(updates), product_param=len(updates) + 1)
+
+
+UPDATE_PRODUCT_SQL = {
+    key: build_update_product_sql(*key)
+    for key in [(True, False), (False, True), (True, True)]
+}
+
+
+@query.field("productSales")
+async def resolve_product_sales(_, info, startDate, endDate, productId=None, categoryId=None,
+                                limit=10, offset=0, sortBy="order_date", sortOrder="ASC"):
+    params = [parse_timestamp(startDate), parse_timestamp(endDate)]
+    if productId:
+        params.append(productId)
+    if categoryId:
+        params.append(categoryId)
+
+    query = PRODUCT_SALES_SQL[(
+        bool(productId),
+        bool(categoryId),
+        sortBy if sortBy in ORDER_SORT_COLUMNS else "order_date",
+        sortOrder if sortOrder in SORT_ORDERS else "ASC"
+    )]
+    async with get_pool(info).acquire() as conn:
+        return await conn.fetchval(query, *params, limit, offset)
+
+
+@query.field("customerPurchaseHistory")
+async def resolve_customer_purchase_history(_, info, customerId, startDate=None, endDate=None,
+                                            limit=10, offset=0, sortBy="order_date", sortOrder="DESC"):
+    params = [customerId]
+    if startDate:
+        params.append(parse_timestamp(startDate))
+    if endDate:
+        params.append(parse_timestamp(endDate))
+
+    query = CUSTOMER_PURCHASE_HISTORY_SQL[(
+        bool(startDate),
+        bool(endDate),
+        sortBy if sortBy in ORDER_SORT_COLUMNS else "order_date",
+        sortOrder if sortOrder in SORT_ORDERS else "DESC"
+    )]
+    async with get_pool(info).acquire() as conn:
+        return await conn.fetchval(query, *params, limit, offset)
+
+
+@query.field("topSellingProductsByCategory")
+async def resolve_top_selling_products(_, info, categoryId, startDate=None, endDate=None,
+                                       limit=10, sortBy="total_units_sold", sortOrder="DESC"):
+    # Reads the per-day pre-aggregated view, so the date range is whole days (endDate inclusive)
+    params = [categoryId]
+    if startDate:
+        params.append(parse_date(startDate))
+    if endDate:
+        params.append(parse_date(endDate))
+
+    sort_by = sortBy if sortBy in PRODUCT_SUMMARY_SORT_COLUMNS else "total_units_sold"
+    sort_order = sortOrder if sortOrder in SORT_ORDERS else "DESC"
+    query = TOP_SELLING_PRODUCTS_SQL[(bool(startDate), bool(endDate), sort_by, sort_order)]
+
+    async def load():
+        async with get_pool(info).acquire() as conn:
+            return await conn.fetchval(query, *params, limit)
+
+    return await cached(
+        ("topSellingProductsByCategory", categoryId, startDate, endDate, limit, sort_by, sort_order), load)
+
+
+@query.field("salesTrends")
+async def resolve_sales_trends(_, info, startDate, endDate, interval="day"):
+    interval_map = {"day": "day", "week": "week", "month": "month"}
+    trunc_interval = interval_map.get(interval, "day")
+
+    async def load():
+        async with get_pool(info).acquire() as conn:
+            return await conn.fetchval(SALES_TRENDS_SQL, trunc_interval, parse_date(startDate), parse_date(endDate))
+
+    return await cached(("salesTrends", startDate, endDate, trunc_interval), load)
+
+
+@mutation.field("updateProduct")
+async def resolve_update_product(_, info, productId, name=None, price=None):
     params = []
     if name:
-        updates.append("name = %s")
         params.append(name)
     if price is not None:  # Allow price to be 0
-        updates.append("price = %s")
         params.append(price)
 
-    if not updates:
-        cursor.close()
-        conn.close()
+    if not params:
         raise ValueError("No fields provided to update")
 
-    params.append(productId)
-    query = f"""
-        UPDATE products 
-        SET {', '.join(updates)}, updated_at = NOW()
-        WHERE product_id = %s
-        RETURNING product_id, name, price, category_id
-    """
-    cursor.execute(query, params)
-    result = cursor.fetchone()
-    conn.commit()
-
-    # Fetch category details
-    cursor.execute("SELECT category_id, name FROM product_categories WHERE category_id = %s", (result["category_id"],))
-    category = cursor.fetchone()
-
-    cursor.close()
-    conn.close()
+    query = UPDATE_PRODUCT_SQL[(bool(name), price is not None)]
+    async with get_pool(info).acquire() as conn:
+        result = await conn.fetchrow(query, *params, productId)
+        if result:
+            # Cached top-selling results carry product names. Notify rather than clearing this worker's
+            # cache directly, so every worker's listener drops its copy and re-queries the new name.
+            await conn.execute(f"NOTIFY {ETL_LOADED_CHANNEL}")
 
     if not result:
         raise ValueError(f"Product with ID {productId} not found")
 
+    # Seed the loader so Product.category resolves without another query
+    info.context["loaders"]["category"].prime(
+        result["category_id"], {"category_id": result["category_id"], "name": result["category_name"]})
+
     return {
         "product_id": result["product_id"],
         "name": result["name"],
         "price": float(result["price"]),
-        "category": {"category_id": category["category_id"], "name": category["name"]}
+        "category_id": result["category_id"]
     }
 
 
+@product.field("category")
+async def resolve_product_category(obj, info):
+    return await info.context["loaders"]["category"].load(obj["category_id"])
+
+
 # Create executable schema
-schema = make_executable_schema(type_defs, [query, mutation])
+schema = make_executable_schema(type_defs, [query, mutation, product])
 
 # FastAPI app with CORS
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -241,11 +442,86 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-graphql_app = GraphQL(schema, debug=True)
+
+@app.on_event("startup")
+async def create_db_pool():
+    app.state.pool = await create_pool()
+    # Dedicated connection (outside the pool) that stays subscribed to ETL notifications
+    app.state.listener = await asyncpg.connect(**DB_SETTINGS)
+    await app.state.listener.add_listener(ETL_LOADED_CHANNEL, invalidate_analytics_cache)
+
+
+@app.on_event("shutdown")
+async def close_db_pool():
+    await app.state.listener.close()
+    await app.state.pool.close()
+
+
+# Loaders are per request so their caches never leak data between requests
+def get_context(request, data):
+    return {"request": request, "loaders": {"category": CategoryLoader(request.app.state.pool)}}
+
+
+# Serialize GraphQL results with orjson instead of the stdlib encoder behind Starlette's JSONResponse
+class ORJSONHTTPHandler(GraphQLHTTPHandler):
+    async def create_json_response(self, request, result, success):
+        return ORJSONResponse(result, status_code=200 if success else 400)
+
+
+graphql_app = GraphQL(schema, context_value=get_context, http_handler=ORJSONHTTPHandler(), debug=True)
 
 # Handle POST and GET requests to /graphql
 app.mount("/graphql", graphql_app)
 
+
+# Unit Tests
+def test_parse_timestamp():
+    assert parse_timestamp("2023-01-01") == datetime(2023, 1, 1)
+    assert parse_timestamp("2023-01-01T05:30:00Z") == datetime(2023, 1, 1, 5, 30)
+    assert parse_timestamp("2023-01-01T05:30:00+02:00") == datetime(2023, 1, 1, 5, 30)
+    assert parse_timestamp(None) is None
+
+
+def test_parse_date():
+    assert parse_date("2023-01-01") == datetime(2023, 1, 1).date()
+    assert parse_date("2023-01-01T23:00:00") == datetime(2023, 1, 1).date()
+    assert parse_date(None) is None
+
+
+def test_cached_releases_lock_when_load_fails():
+    async def load():
+        raise ValueError("query failed")
+
+    with pytest.raises(ValueError):
+        asyncio.run(cached(("test", "failing"), load))
+    assert ("test", "failing") not in analytics_cache_locks
+    assert ("test", "failing") not in analytics_cache
+
+
+# Each variant must number its placeholders $1..$n with no gaps, n being the arguments its resolver binds
+def placeholders(sql):
+    return sorted({int(n) for n in re.findall(r"\$(\d+)", sql)})
+
+
+def test_sql_placeholders_match_arguments():
+    for (has_product, has_category, _, _), sql in PRODUCT_SALES_SQL.items():
+        # startDate, endDate, [productId], [categoryId], limit, offset
+        assert placeholders(sql) == list(range(1, 2 + has_product + has_category + 2 + 1))
+    for (has_start, has_end, _, _), sql in CUSTOMER_PURCHASE_HISTORY_SQL.items():
+        # customerId, [startDate], [endDate], limit, offset
+        assert placeholders(sql) == list(range(1, 1 + has_start + has_end + 2 + 1))
+    for (has_start, has_end, _, _), sql in TOP_SELLING_PRODUCTS_SQL.items():
+        # categoryId, [startDate], [endDate], limit
+        assert placeholders(sql) == list(range(1, 1 + has_start + has_end + 1 + 1))
+    for (has_name, has_price), sql in UPDATE_PRODUCT_SQL.items():
+        # [name], [price], productId
+        assert placeholders(sql) == list(range(1, has_name + has_price + 1 + 1))
+    # interval, startDate, endDate
+    assert placeholders(SALES_TRENDS_SQL) == [1, 2, 3]
+    assert len(PRODUCT_SALES_SQL) == len(CUSTOMER_PURCHASE_HISTORY_SQL) == 16
+    assert len(TOP_SELLING_PRODUCTS_SQL) == 24
+
+
 # if __name__ == "__main__":
 #     import uvicorn
 #     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -12,6 +12,7 @@ fake = Faker()
 Faker.seed(42)
 np.random.seed(42)
 random.seed(42)
+rng = np.random.default_rng(42)
 
 # Create output directory
 output_dir = "ecommerce_data"
@@ -23,6 +24,13 @@ NUM_PRODUCTS = 1000
 NUM_CUSTOMERS = 5000
 NUM_ORDERS = 1000
 NUM_ORDER_ITEMS = 10000
+MAX_ITEMS_PER_ORDER = 5
+
+
+# Draw `size` uniformly distributed timestamps between start and end (formatted like the CSVs)
+def random_datetimes(start, end, size):
+    start = pd.DatetimeIndex(np.broadcast_to(pd.to_datetime(start), size))
+    return (start + (pd.Timestamp(end) - start) * rng.random(size)).strftime('%Y-%m-%d %H:%M:%S')
 
 
 # Generate product categories
@@ -66,77 +74,70 @@ def generate_product_categories():
 def generate_products(categories_df):
     print("Generating products...")
 
-    products = []
-
-    # Get all category IDs
-    category_ids = categories_df['category_id'].tolist()
-
-    for i in tqdm(range(NUM_PRODUCTS)):
-        product_id = i + 1
-
-        # Generate a product name based on categories
-        category_id = random.choice(category_ids)
-        category_name = categories_df[categories_df['category_id'] == category_id]['name'].iloc[0]
-
-        # Create the product
-        product = {
-            'product_id': product_id,
-            'name': f"{fake.word().capitalize()} {category_name} {fake.word().capitalize()}",
-            'description': fake.paragraph(),
-            'price': round(random.uniform(5.99, 499.99), 2),
-            'cost': None,  # Will be filled after
-            'category_id': category_id,
-            'sku': f"SKU-{fake.bothify(text='??###')}",
-            'inventory_count': random.randint(0, 500),
-            'weight': round(random.uniform(0.1, 20.0), 2),
-            'created_at': fake.date_time_between(start_date='-5y', end_date='now').strftime('%Y-%m-%d %H:%M:%S'),
-            'is_active': random.random() > 0.1  # 90% are active
-        }
+    # Pick a category per product and look the names up in one indexed pass
+    category_ids = rng.choice(categories_df['category_id'].to_numpy(), NUM_PRODUCTS)
+    category_names = categories_df.set_index('category_id')['name'].loc[category_ids]
 
-        # Set cost at 40-80% of the price
-        product['cost'] = round(product['price'] * random.uniform(0.4, 0.8), 2)
+    # Prices, and cost at 40-80% of the price
+    prices = np.round(rng.uniform(5.99, 499.99, NUM_PRODUCTS), 2)
+    costs = np.round(prices * rng.uniform(0.4, 0.8, NUM_PRODUCTS), 2)
 
-        products.append(product)
+    now = pd.Timestamp.now()
 
-    return pd.DataFrame(products)
+    return pd.DataFrame({
+        'product_id': np.arange(1, NUM_PRODUCTS + 1),
+        'name': [f"{fake.word().capitalize()} {category_name} {fake.word().capitalize()}"
+                 for category_name in category_names],
+        'description': [fake.paragraph() for _ in range(NUM_PRODUCTS)],
+        'price': prices,
+        'cost': costs,
+        'category_id': category_ids,
+        'sku': [f"SKU-{fake.bothify(text='??###')}" for _ in range(NUM_PRODUCTS)],
+        'inventory_count': rng.integers(0, 500, NUM_PRODUCTS, endpoint=True),
+        'weight': np.round(rng.uniform(0.1, 20.0, NUM_PRODUCTS), 2),
+        'created_at': random_datetimes(now - pd.DateOffset(years=5), now, NUM_PRODUCTS),
+        'is_active': rng.random(NUM_PRODUCTS) > 0.1  # 90% are active
+    })
 
 
 # Generate customers
 def generate_customers():
     print("Generating customers...")
 
-    customers = []
-
-    for i in tqdm(range(NUM_CUSTOMERS)):
-        # Generate address components
-        street = fake.street_address()
-        city = fake.city()
-        state = fake.state_abbr()
-        zip_code = fake.zipcode()
-
-        # Create registration date (weighted towards more recent dates)
-        days_ago = int(np.random.power(0.5) * 1825)  # Biased towards recent (0-5 years)
-        registration_date = datetime.datetime.now() - datetime.timedelta(days=days_ago)
-
-        # Create customer
-        customer = {
-            'customer_id': i + 1,
-            'email': fake.unique.email(),
-            'first_name': fake.first_name(),
-            'last_name': fake.last_name(),
-            'street_address': street,
-            'city': city,
-            'state': state,
-            'zip_code': zip_code,
-            'country': 'US',
-            'phone': fake.phone_number(),
-            'registration_date': registration_date.strftime('%Y-%m-%d %H:%M:%S'),
-            'last_login': fake.date_time_between(start_date=registration_date, end_date='now').strftime(
-                '%Y-%m-%d %H:%M:%S')
-        }
-        customers.append(customer)
-
-    return pd.DataFrame(customers)
+    # Registration dates (weighted towards more recent dates, 0-5 years)
+    now = pd.Timestamp.now()
+    days_ago = (rng.power(0.5, NUM_CUSTOMERS) * 1825).astype(int)
+    registration_dates = now - pd.to_timedelta(days_ago, unit='D')
+
+    customer_ids = np.arange(1, NUM_CUSTOMERS + 1)
+    first_names = [fake.first_name() for _ in range(NUM_CUSTOMERS)]
+    last_names = [fake.last_name() for _ in range(NUM_CUSTOMERS)]
+
+    # Emails are unique by construction (the customer id is part of them), so there is no need
+    # for Faker's unique proxy and its ever-growing set of already generated values
+    emails = [f"{first}.{last}.{customer_id}@example.com".lower()
+              for customer_id, first, last in zip(customer_ids, first_names, last_names)]
+
+    # US-style phone numbers from random digit groups (Faker's pattern-based phone_number is slow)
+    area_codes = rng.integers(201, 990, NUM_CUSTOMERS)
+    exchanges = rng.integers(200, 1000, NUM_CUSTOMERS)
+    lines = rng.integers(0, 10000, NUM_CUSTOMERS)
+    phones = [f"({area}) {exchange}-{line:04d}" for area, exchange, line in zip(area_codes, exchanges, lines)]
+
+    return pd.DataFrame({
+        'customer_id': customer_ids,
+        'email': emails,
+        'first_name': first_names,
+        'last_name': last_names,
+        'street_address': [fake.street_address() for _ in range(NUM_CUSTOMERS)],
+        'city': [fake.city() for _ in range(NUM_CUSTOMERS)],
+        'state': [fake.state_abbr() for _ in range(NUM_CUSTOMERS)],
+        'zip_code': [fake.zipcode() for _ in range(NUM_CUSTOMERS)],
+        'country': 'US',
+        'phone': phones,
+        'registration_date': registration_dates.strftime('%Y-%m-%d %H:%M:%S'),
+        'last_login': random_datetimes(registration_dates, now, NUM_CUSTOMERS)
+    })
 
 
 # Generate orders and order items
@@ -148,142 +149,143 @@ def generate_orders_and_items(customers_df, products_df):
     product_ids = products_df['product_id'].tolist()
     product_prices = products_df.set_index('product_id')['price'].to_dict()
 
-    orders = []
-    order_items = []
+    # Item column buffers (one array per column), filled in place instead of appending a dict per row.
+    # An order can push the item count up to MAX_ITEMS_PER_ORDER - 1 past NUM_ORDER_ITEMS.
+    item_capacity = NUM_ORDER_ITEMS + MAX_ITEMS_PER_ORDER
+    o_total_amount = np.empty(NUM_ORDERS, dtype=np.float64)
+    oi_order_id = np.empty(item_capacity, dtype=np.int64)
+    oi_product_id = np.empty(item_capacity, dtype=np.int64)
+    oi_quantity = np.empty(item_capacity, dtype=np.int8)
+    oi_price = np.empty(item_capacity, dtype=np.float64)
+    oi_discount = np.empty(item_capacity, dtype=np.float64)
+    oi_total = np.empty(item_capacity, dtype=np.float64)
 
     # Prepare distribution: some customers make more orders than others
     # Follow a Pareto distribution (80/20 rule)
-    orders_per_customer = np.random.pareto(1.5, len(customer_ids)) + 1
+    orders_per_customer = rng.pareto(1.5, len(customer_ids)) + 1
     orders_per_customer = np.minimum(orders_per_customer, 50)  # Cap at 50 orders per customer
     orders_per_customer = orders_per_customer.astype(int)
 
-    # Mapping of customers to their order counts
-    customer_order_counts = dict(zip(customer_ids, orders_per_customer))
-
-    # Generate orders
-    order_id_counter = 1
-    order_item_id_counter = 1
-
-    for customer_id in tqdm(customer_ids):
-        num_orders = customer_order_counts[customer_id]
-
-        # Skip some customers (those who registered but never ordered)
-        if random.random() < 0.05:  # 5% of customers have no orders
-            continue
-
-        # Get registration date for this customer
-        customer_reg_date = pd.to_datetime(
-            customers_df[customers_df['customer_id'] == customer_id]['registration_date'].iloc[0])
-
-        for _ in range(num_orders):
-            # Order date between registration and now
-            days_since_reg = (datetime.datetime.now() - customer_reg_date).days
-            if days_since_reg <= 0:
-                continue  # Skip if registration date is in the future (shouldn't happen but just in case)
-
-            # Order date (weighted towards more recent dates)
-            days_ago = int(np.random.power(0.7) * days_since_reg)
-            order_date = datetime.datetime.now() - datetime.timedelta(days=days_ago)
-
-            # Shipping and other dates
-            processing_days = random.randint(0, 2)
-            shipping_days = random.randint(1, 7)
-            delivery_days = shipping_days + random.randint(1, 3)
-
-            processing_date = order_date + datetime.timedelta(days=processing_days)
-            shipping_date = processing_date + datetime.timedelta(days=shipping_days)
-            delivery_date = shipping_date + datetime.timedelta(days=delivery_days)
-
-            # Order status
-            current_date = datetime.datetime.now()
-
-            if order_date > current_date:
-                status = 'Pending'
-            elif processing_date > current_date:
-                status = 'Processing'
-            elif shipping_date > current_date:
-                status = 'Shipped'
-            elif delivery_date > current_date:
-                status = 'In Transit'
-            else:
-                status = 'Delivered'
-
-            # Payment information
-            payment_method = random.choice(['Credit Card', 'PayPal', 'Apple Pay', 'Google Pay', 'Gift Card'])
-
-            # Create order
-            order = {
-                'order_id': order_id_counter,
-                'customer_id': customer_id,
-                'order_date': order_date.strftime('%Y-%m-%d %H:%M:%S'),
-                'status': status,
-                'payment_method': payment_method,
-                'shipping_address': customers_df[customers_df['customer_id'] == customer_id]['street_address'].iloc[0],
-                'shipping_city': customers_df[customers_df['customer_id'] == customer_id]['city'].iloc[0],
-                'shipping_state': customers_df[customers_df['customer_id'] == customer_id]['state'].iloc[0],
-                'shipping_zip': customers_df[customers_df['customer_id'] == customer_id]['zip_code'].iloc[0],
-                'shipping_country': 'US',
-                'processing_date': processing_date.strftime('%Y-%m-%d %H:%M:%S'),
-                'shipping_date': shipping_date.strftime('%Y-%m-%d %H:%M:%S'),
-                'delivery_date': delivery_date.strftime('%Y-%m-%d %H:%M:%S'),
-                'total_amount': 0  # Will be calculated based on items
-            }
-
-            # Add order items (random number between 1 and 5)
-            num_items = random.choices([1, 2, 3, 4, 5], weights=[0.5, 0.25, 0.15, 0.07, 0.03])[0]
-            order_products = random.sample(product_ids, num_items)
-
-            order_total = 0
-
-            for product_id in order_products:
-                # Item quantity (usually 1, sometimes more)
-                quantity = random.choices([1, 2, 3, 4, 5], weights=[0.7, 0.15, 0.08, 0.05, 0.02])[0]
-
-                # Price at time of order (slightly different from current price)
-                current_price = product_prices[product_id]
-                historic_price = round(current_price * random.uniform(0.95, 1.05), 2)
-
-                # Discounts (most items have no discount)
-                discount_pct = random.choices([0, 5, 10, 15, 20], weights=[0.8, 0.1, 0.05, 0.03, 0.02])[0]
-                discount = round((discount_pct / 100) * historic_price * quantity, 2)
-
-                # Calculate item total
-                item_total = round(historic_price * quantity - discount, 2)
-                order_total += item_total
-
-                # Create order item
-                order_item = {
-                    'order_item_id': order_item_id_counter,
-                    'order_id': order_id_counter,
-                    'product_id': product_id,
-                    'quantity': quantity,
-                    'price': historic_price,
-                    'discount': discount,
-                    'total': item_total
-                }
-
-                order_items.append(order_item)
-                order_item_id_counter += 1
-
-            # Update order total
-            order['total_amount'] = round(order_total, 2)
-            orders.append(order)
-            order_id_counter += 1
-
-            # Limit number of orders and items for testing purposes
-            if order_id_counter > NUM_ORDERS:
-                break
-
-            if order_item_id_counter > NUM_ORDER_ITEMS:
-                break
-
-        if order_id_counter > NUM_ORDERS:
-            break
-
-        if order_item_id_counter > NUM_ORDER_ITEMS:
-            break
-
-    return pd.DataFrame(orders), pd.DataFrame(order_items)
+    # Draw every random value up front in one vectorized call per kind; the loops below just
+    # consume them by position (per customer, per order slot or per item slot)
+    skips_customer = rng.random(len(customer_ids)) < 0.05  # 5% of customers have no orders
+    order_date_weights = rng.power(0.7, NUM_ORDERS)  # Weighted towards more recent dates
+    processing_days_arr = rng.integers(0, 2, NUM_ORDERS, endpoint=True)
+    shipping_days_arr = rng.integers(1, 7, NUM_ORDERS, endpoint=True)
+    delivery_days_arr = shipping_days_arr + rng.integers(1, 3, NUM_ORDERS, endpoint=True)
+    payment_method_arr = rng.choice(['Credit Card', 'PayPal', 'Apple Pay', 'Google Pay', 'Gift Card'], NUM_ORDERS)
+    num_items_arr = rng.choice([1, 2, 3, 4, 5], NUM_ORDERS, p=[0.5, 0.25, 0.15, 0.07, 0.03])
+    quantity_arr = rng.choice([1, 2, 3, 4, 5], item_capacity, p=[0.7, 0.15, 0.08, 0.05, 0.02])
+    discount_pct_arr = rng.choice([0, 5, 10, 15, 20], item_capacity, p=[0.8, 0.1, 0.05, 0.03, 0.02])
+    price_multiplier_arr = rng.uniform(0.95, 1.05, item_capacity)
+    product_ids_arr = np.asarray(product_ids)
+
+    # Order dates fall between registration and now
+    days_since_reg_arr = (pd.Timestamp.now() - pd.to_datetime(customers_df['registration_date'])).dt.days.to_numpy()
+
+    # Skip some customers (those who registered but never ordered), and those registered too
+    # recently to have an order date (registration date in the future shouldn't happen but just in case)
+    orders_per_customer[skips_customer | (days_since_reg_arr <= 0)] = 0
+
+    # Size the loops up front instead of checking limits while generating: stop at NUM_ORDERS orders,
+    # or at the order that brings the item count to NUM_ORDER_ITEMS (that order is kept whole)
+    total_orders = min(NUM_ORDERS, int(np.searchsorted(np.cumsum(num_items_arr), NUM_ORDER_ITEMS)) + 1)
+    cum = np.cumsum(orders_per_customer)
+    cut = int(np.searchsorted(cum, total_orders))
+    if cut < len(cum):
+        orders_per_customer[cut] = total_orders - (cum[cut - 1] if cut else 0)
+        orders_per_customer = orders_per_customer[:cut + 1]
+
+    # Per-order columns, computed for all orders at once (orders of a customer are consecutive)
+    order_customer_idx = np.repeat(np.arange(len(orders_per_customer)), orders_per_customer)
+    num_orders = len(order_customer_idx)
+    o_customer_id = np.asarray(customer_ids)[order_customer_idx]
+
+    # Order date (weighted towards more recent dates)
+    now = np.datetime64(datetime.datetime.now(), 'us')
+    days_ago = (order_date_weights[:num_orders] * days_since_reg_arr[order_customer_idx]).astype(int)
+    o_order_date = now - days_ago.astype('timedelta64[D]')
+
+    # Shipping and other dates
+    o_processing_date = o_order_date + processing_days_arr[:num_orders].astype('timedelta64[D]')
+    o_shipping_date = o_processing_date + shipping_days_arr[:num_orders].astype('timedelta64[D]')
+    o_delivery_date = o_shipping_date + delivery_days_arr[:num_orders].astype('timedelta64[D]')
+
+    # Order status: the first milestone still in the future, Delivered if all have passed
+    o_status = np.select(
+        [o_order_date > now, o_processing_date > now, o_shipping_date > now, o_delivery_date > now],
+        ['Pending', 'Processing', 'Shipped', 'In Transit'],
+        default='Delivered'
+    )
+    o_payment_method = payment_method_arr[:num_orders]
+
+    # Generate order items (item_idx is the next free slot, ids are slot + 1)
+    item_idx = 0
+
+    for order_idx in tqdm(range(num_orders)):
+        # Add order items (random number between 1 and 5, distinct products)
+        order_products = rng.choice(product_ids_arr, num_items_arr[order_idx], replace=False)
+
+        order_total = 0
+
+        for product_id in order_products:
+            # Item quantity (usually 1, sometimes more)
+            quantity = int(quantity_arr[item_idx])
+
+            # Price at time of order (slightly different from current price)
+            current_price = product_prices[product_id]
+            historic_price = round(current_price * price_multiplier_arr[item_idx], 2)
+
+            # Discounts (most items have no discount)
+            discount_pct = discount_pct_arr[item_idx]
+            discount = round((discount_pct / 100) * historic_price * quantity, 2)
+
+            # Calculate item total
+            item_total = round(historic_price * quantity - discount, 2)
+            order_total += item_total
+
+            # Record the order item
+            oi_order_id[item_idx] = order_idx + 1
+            oi_product_id[item_idx] = product_id
+            oi_quantity[item_idx] = quantity
+            oi_price[item_idx] = historic_price
+            oi_discount[item_idx] = discount
+            oi_total[item_idx] = item_total
+            item_idx += 1
+
+        # Update order total
+        o_total_amount[order_idx] = round(order_total, 2)
+
+    # Shipping details come from each order's customer, looked up for all orders at once
+    shipping = customers_df.set_index('customer_id').loc[o_customer_id]
+    date_format = '%Y-%m-%d %H:%M:%S'
+
+    orders_df = pd.DataFrame({
+        'order_id': np.arange(1, num_orders + 1),
+        'customer_id': o_customer_id,
+        'order_date': pd.DatetimeIndex(o_order_date).strftime(date_format),
+        'status': o_status,
+        'payment_method': o_payment_method,
+        'shipping_address': shipping['street_address'].to_numpy(),
+        'shipping_city': shipping['city'].to_numpy(),
+        'shipping_state': shipping['state'].to_numpy(),
+        'shipping_zip': shipping['zip_code'].to_numpy(),
+        'shipping_country': 'US',
+        'processing_date': pd.DatetimeIndex(o_processing_date).strftime(date_format),
+        'shipping_date': pd.DatetimeIndex(o_shipping_date).strftime(date_format),
+        'delivery_date': pd.DatetimeIndex(o_delivery_date).strftime(date_format),
+        'total_amount': o_total_amount[:num_orders]
+    })
+    order_items_df = pd.DataFrame({
+        'order_item_id': np.arange(1, item_idx + 1),
+        'order_id': oi_order_id[:item_idx],
+        'product_id': oi_product_id[:item_idx],
+        'quantity': oi_quantity[:item_idx],
+        'price': oi_price[:item_idx],
+        'discount': oi_discount[:item_idx],
+        'total': oi_total[:item_idx]
+    })
+    return orders_df, order_items_df
 
 
 # Create smaller sample datasets
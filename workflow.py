@@ -1,45 +1,70 @@
+import io
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
 import psycopg2
-from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 import logging
 import os
-import time
 import pytest
+from contextlib import contextmanager
 from flytekit import task, workflow, Resources
 from typing import List, Optional, Dict
-from datetime import datetime, timedelta
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
 
-# Database connection using environment variables
-def get_db_connection():
-    return psycopg2.connect(
-        dbname=os.getenv("DATABASE_NAME", "ecommerce"),
-        user=os.getenv("DATABASE_USER", "admin"),
-        password=os.getenv("DATABASE_PASSWORD", "password"),
-        host=os.getenv("DATABASE_HOST", "postgres"),
-        port=os.getenv("DATABASE_PORT", "5432")
-    )
+# Database connections using environment variables, pooled so tasks running in the same process reuse
+# connections instead of paying a connect + auth handshake each. Created on first use, not at import.
+_db_pool = None
 
 
-# Flyte task to extract data from CSV with chunking
-@task(requests=Resources(cpu="1", mem="1Gi"))
-def extract_csv(file_path: str, chunk_size: int = 10000) -> List[pd.DataFrame]:
-    logger.info(f"Extracting data from {file_path} in chunks of {chunk_size}")
-    chunks = []
-    for chunk in pd.read_csv(file_path, chunksize=chunk_size):
-        chunks.append(chunk)
-    return chunks
+def get_db_pool():
+    global _db_pool
+    if _db_pool is None:
+        _db_pool = ThreadedConnectionPool(
+            1, 8,
+            dbname=os.getenv("DATABASE_NAME", "ecommerce"),
+            user=os.getenv("DATABASE_USER", "admin"),
+            password=os.getenv("DATABASE_PASSWORD", "password"),
+            host=os.getenv("DATABASE_HOST", "postgres"),
+            port=os.getenv("DATABASE_PORT", "5432")
+        )
+    return _db_pool
 
 
-# Flyte task to concatenate chunks into a single DataFrame
-@task(requests=Resources(cpu="1", mem="2Gi"))
-def concatenate_chunks(chunks: List[pd.DataFrame]) -> pd.DataFrame:
-    logger.info("Concatenating chunks into a single DataFrame")
-    return pd.concat(chunks)
+@contextmanager
+def db_conn():
+    pool = get_db_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+
+# Bulk loads go through COPY. COPY cannot skip conflicting rows, so rows are streamed into a temp staging
+# table (dropped on commit) and moved over with INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+def create_staging_table(cursor, table_name, columns):
+    staging_table = f"staging_{table_name}"
+    cursor.execute(f"CREATE TEMP TABLE {staging_table} ON COMMIT DROP AS "
+                   f"SELECT {','.join(columns)} FROM {table_name} WITH NO DATA")
+    return staging_table
+
+
+def copy_frame(cursor, df, staging_table, columns):
+    buffer = io.StringIO()
+    df[columns].to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {staging_table} ({','.join(columns)}) FROM STDIN WITH (FORMAT CSV)", buffer)
+
+
+def insert_from_staging(cursor, staging_table, table_name, columns):
+    cursor.execute(f"INSERT INTO {table_name} ({','.join(columns)}) SELECT {','.join(columns)} "
+                   f"FROM {staging_table} ON CONFLICT DO NOTHING")
 
 
 # Flyte task to generate and load time dimension data
@@ -47,182 +72,211 @@ def concatenate_chunks(chunks: List[pd.DataFrame]) -> pd.DataFrame:
 def populate_dim_time(start_date: str = "2021-01-01", end_date: str = "2025-12-31") -> int:
     logger.info(f"Populating dim_time from {start_date} to {end_date}")
 
-    # Generate date range
-    start = datetime.strptime(start_date, "%Y-%m-%d")
-    end = datetime.strptime(end_date, "%Y-%m-%d")
-    date_list = [start + timedelta(days=x) for x in range((end - start).days + 1)]
-
-    # Create DataFrame with time dimension attributes
-    dim_time_data = []
-    for date in date_list:
-        dim_time_data.append([
-            date.strftime("%Y-%m-%d"),  # date
-            date.weekday() + 1,  # day_of_week (1-7, Mon-Sun)
-            date.day,  # day_of_month
-            date.timetuple().tm_yday,  # day_of_year
-            date.isocalendar()[1],  # week_of_year
-            date.month,  # month
-            date.strftime("%B"),  # month_name
-            (date.month - 1) // 3 + 1,  # quarter
-            date.year,  # year
-            date.weekday() >= 5,  # is_weekend (Sat/Sun)
-            False  # is_holiday (simplified, could integrate holiday list)
-        ])
-
-    columns = [
-        "date", "day_of_week", "day_of_month", "day_of_year", "week_of_year",
-        "month", "month_name", "quarter", "year", "is_weekend", "is_holiday"
-    ]
-    dim_time_df = pd.DataFrame(dim_time_data, columns=columns)
-
-    # Convert to list of tuples for bulk insert
-    data_rows = [tuple(row) for row in dim_time_df.values]
+    # Generate date range and derive every time dimension attribute from it in one vectorized pass
+    dates = pd.date_range(start_date, end_date, freq="D")
+    dim_time_df = pd.DataFrame({
+        "date": dates.strftime("%Y-%m-%d"),
+        "day_of_week": dates.dayofweek + 1,  # 1-7, Mon-Sun
+        "day_of_month": dates.day,
+        "day_of_year": dates.dayofyear,
+        "week_of_year": dates.isocalendar().week.to_numpy(),
+        "month": dates.month,
+        "month_name": dates.month_name(),
+        "quarter": dates.quarter,
+        "year": dates.year,
+        "is_weekend": dates.dayofweek >= 5,  # Sat/Sun
+        "is_holiday": False  # simplified, could integrate holiday list
+    })
 
     # Load into database
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        # Clear existing data (for idempotency in this demo)
-        cursor.execute("TRUNCATE TABLE dim_time")
-
-        # Insert new data
-        query = f"""
-            INSERT INTO dim_time (
-                date, day_of_week, day_of_month, day_of_year, week_of_year,
-                month, month_name, quarter, year, is_weekend, is_holiday
-            ) VALUES %s
-            ON CONFLICT (date) DO NOTHING
-        """
-        execute_values(cursor, query, data_rows)
-        conn.commit()
-        logger.info(f"Loaded {len(data_rows)} rows into dim_time")
-        return len(data_rows)
-    except Exception as e:
-        logger.error(f"Failed to populate dim_time: {str(e)}")
-        conn.rollback()
-        raise
-    finally:
-        cursor.close()
-        conn.close()
+    with db_conn() as conn:
+        cursor = conn.cursor()
+        try:
+            # Clear existing data (for idempotency in this demo)
+            cursor.execute("TRUNCATE TABLE dim_time")
+
+            # The table was just emptied and every date is unique, so nothing can conflict and the rows
+            # are COPYed straight in (no staging table, no per-page INSERT to parse and plan)
+            copy_frame(cursor, dim_time_df, "dim_time", list(dim_time_df.columns))
+            conn.commit()
+            logger.info(f"Loaded {len(dim_time_df)} rows into dim_time")
+            return len(dim_time_df)
+        except Exception as e:
+            logger.error(f"Failed to populate dim_time: {str(e)}")
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
 
 
 # Flyte task to transform data with business rules
 @task(requests=Resources(cpu="1", mem="2Gi"))
 def transform_data(df: pd.DataFrame, table_name: str, columns: List[str],
                    products_df: Optional[pd.DataFrame] = None,
-                   orders_df: Optional[pd.DataFrame] = None) -> List[List[str]]:
+                   not_null_cols: Optional[List[str]] = None) -> pd.DataFrame:
     logger.info(f"Transforming data for {table_name}")
+    # Rows are dropped only when a column the table requires is missing (every column if unspecified)
+    not_null_cols = not_null_cols or columns
 
     # Specific business rules
     if table_name == "products" and products_df is not None:
         pass  # Join handled in DB schema
 
     elif table_name == "order_items":
-        # Calculate revenue (price × quantity - discount)
-        df["price"] = df["price"].astype(float)
-        df["quantity"] = df["quantity"].astype(int)
-        df["discount"] = df["discount"].astype(float)
-        df["total"] = (df["price"] * df["quantity"]) - df["discount"]
-        df = df.dropna(subset=columns)
-
-    elif table_name == "customers" and orders_df is not None:
-        # Enrich with total lifetime value
-        orders_agg = orders_df.groupby("customer_id")["total_amount"].sum().reset_index()
-        orders_agg = orders_agg.rename(columns={"total_amount": "lifetime_value"})
-        df = df.merge(orders_agg, on="customer_id", how="left")
-        df["lifetime_value"] = df["lifetime_value"].fillna(0).astype(float)
-        df = df.dropna(subset=[col for col in columns if col != "lifetime_value"])  # Exclude lifetime_value from dropna
+        # Calculate revenue (price × quantity - discount) in one pass over float64 buffers, reusing the
+        # product's buffer for the result (float64 keeps totals exact to the cent for DECIMAL(10, 2))
+        total = np.multiply(df["price"].to_numpy(np.float64, na_value=np.nan),
+                            df["quantity"].to_numpy(np.float64, na_value=np.nan))
+        np.subtract(total, df["discount"].to_numpy(np.float64, na_value=np.nan), out=total)
+        df["total"] = total
+        df = df.dropna(subset=not_null_cols)
 
     else:
         # Common transformations for other tables
-        df = df.dropna(subset=columns)
+        df = df.dropna(subset=not_null_cols)
 
-    # Type conversion after transformations
-    for col in df.columns:
-        if pd.api.types.is_numeric_dtype(df[col]):
-            df[col] = df[col].astype(float if pd.api.types.is_float_dtype(df[col]) else int)
-        df[col] = df[col].astype(str)
+    # Values keep their native types; Postgres coerces them when stream_etl copies them in
+    return df[columns]
 
-    # Convert to list of lists
-    return [list(row) for row in df[columns].values]
 
-
-# Flyte task to aggregate daily sales
-@task(requests=Resources(cpu="1", mem="2Gi"))
-def aggregate_daily_sales(order_items_df: pd.DataFrame, products_df: pd.DataFrame, orders_df: pd.DataFrame) -> List[
-    List[str]]:
+# Flyte task to aggregate daily sales. The source tables are already loaded, so the aggregate is
+# computed and inserted entirely inside Postgres instead of round-tripping every row through pandas.
+@task(requests=Resources(cpu="1", mem="1Gi"))
+def aggregate_daily_sales_sql(order_items_loaded: int, orders_loaded: int) -> int:
     logger.info("Aggregating daily sales by product and category")
-
-    # Join order_items with orders to get order_date
-    order_items_with_date = order_items_df.merge(
-        orders_df[["order_id", "order_date"]],
-        on="order_id",
-        how="left"
-    )
-
-    # Convert order_date to datetime and extract date
-    order_items_with_date["order_date"] = pd.to_datetime(order_items_with_date["order_date"])
-    order_items_with_date["date"] = order_items_with_date["order_date"].dt.date.astype(str)
-    order_items_with_date["product_id"] = order_items_with_date["product_id"].astype(int)
-
-    # Join with products to get category_id
-    merged = order_items_with_date.merge(
-        products_df[["product_id", "category_id"]],
-        on="product_id",
-        how="left"
-    )
-
-    # Aggregate
-    daily_agg = merged.groupby(["date", "product_id", "category_id"]).agg(
-        units_sold=("quantity", "sum"),
-        revenue=("total", "sum"),
-        order_count=("order_id", "nunique")
-    ).reset_index()
-    daily_agg["avg_unit_price"] = (daily_agg["revenue"] / daily_agg["units_sold"]).fillna(0)
-
-    columns = ["date", "product_id", "category_id", "units_sold", "revenue", "order_count", "avg_unit_price"]
-    return [list(row) for row in daily_agg[columns].astype(str).values]
-
-
-# Flyte task to load data into database
+    with db_conn() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                INSERT INTO daily_sales_aggregation (
+                    date, product_id, category_id, units_sold, revenue, order_count, avg_unit_price
+                )
+                SELECT
+                    DATE(o.order_date),
+                    oi.product_id,
+                    p.category_id,
+                    SUM(oi.quantity),
+                    SUM(oi.total),
+                    COUNT(DISTINCT oi.order_id),
+                    COALESCE(SUM(oi.total) / NULLIF(SUM(oi.quantity), 0), 0)
+                FROM order_items oi
+                JOIN orders o ON oi.order_id = o.order_id
+                JOIN products p ON oi.product_id = p.product_id
+                GROUP BY DATE(o.order_date), oi.product_id, p.category_id
+                ON CONFLICT DO NOTHING
+            """)
+            conn.commit()
+            logger.info(f"Loaded {cursor.rowcount} rows into daily_sales_aggregation")
+            return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Aggregation failed: {str(e)}")
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+
+# Flyte task to total each customer's orders into lifetime_value once both tables are loaded, inside
+# Postgres rather than merging every order against every customer in pandas
 @task(requests=Resources(cpu="1", mem="1Gi"))
-def load_to_db(table_name: str, columns: List[str], data_rows: List[List[str]]) -> int:
-    logger.info(f"Loading data into {table_name}")
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        query = f"INSERT INTO {table_name} ({','.join(columns)}) VALUES %s ON CONFLICT DO NOTHING"
-        execute_values(cursor, query, data_rows)
-        conn.commit()
-        logger.info(f"Loaded {len(data_rows)} rows into {table_name}")
-        return len(data_rows)
-    except Exception as e:
-        logger.error(f"Load failed: {str(e)}")
-        conn.rollback()
-        raise
-    finally:
-        cursor.close()
-        conn.close()
+def update_customer_ltv(customers_loaded: int, orders_loaded: int) -> int:
+    logger.info("Updating customer lifetime values")
+    with db_conn() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                UPDATE customers c
+                SET lifetime_value = s.lifetime_value
+                FROM (
+                    SELECT customer_id, SUM(total_amount) AS lifetime_value
+                    FROM orders
+                    GROUP BY customer_id
+                ) s
+                WHERE c.customer_id = s.customer_id
+            """)
+            conn.commit()
+            logger.info(f"Updated lifetime_value for {cursor.rowcount} customers")
+            return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Lifetime value update failed: {str(e)}")
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+
+# Flyte task to extract, transform and load a CSV as a stream: each block is parsed, put through
+# transform_data's business rules and COPYed into staging before the next is read, so memory stays
+# bounded by block_size bytes whatever the file size. Everything commits in a single transaction.
+@task(requests=Resources(cpu="1", mem="1Gi"))
+def stream_etl(file_path: str, table_name: str, columns: List[str], not_null_cols: Optional[List[str]] = None,
+               dtype: Optional[Dict[str, str]] = None, block_size: int = 8 << 20) -> int:
+    logger.info(f"Streaming {file_path} into {table_name}")
+    with db_conn() as conn:
+        cursor = conn.cursor()
+        try:
+            # The CSVs carry extra columns and duplicate keys, so they can't be COPYed verbatim
+            staging_table = create_staging_table(cursor, table_name, columns)
+            row_count = 0
+            # Arrow's streaming reader parses blocks into columnar buffers (kept as Arrow-backed columns, so
+            # strings aren't Python objects), reading ahead on a background thread. Columns without a declared
+            # dtype are only written back out as CSV, so they are read as text: no type inference, and values
+            # such as zip codes with leading zeros round-trip unchanged
+            column_types = {col: pa.string() for col in columns}
+            column_types.update({col: pa.type_for_alias(type_name) for col, type_name in (dtype or {}).items()})
+            reader = pv.open_csv(
+                file_path,
+                read_options=pv.ReadOptions(block_size=block_size, use_threads=True),
+                # Columns outside the table are skipped by the parser, never materialized; empty fields are
+                # missing values, as they are to pandas
+                convert_options=pv.ConvertOptions(column_types=column_types, include_columns=columns,
+                                                  strings_can_be_null=True)
+            )
+            for batch in reader:
+                chunk = transform_data.task_function(df=batch.to_pandas(types_mapper=pd.ArrowDtype),
+                                                     table_name=table_name, columns=columns,
+                                                     not_null_cols=not_null_cols)
+                copy_frame(cursor, chunk, staging_table, columns)
+                row_count += len(chunk)
+            insert_from_staging(cursor, staging_table, table_name, columns)
+            conn.commit()
+            logger.info(f"Loaded {row_count} rows into {table_name}")
+            return row_count
+        except Exception as e:
+            logger.error(f"Load failed: {str(e)}")
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
 
 
 # Flyte task to refresh materialized view
 @task(requests=Resources(cpu="1", mem="1Gi"))
 def refresh_materialized_view(view_name: str, rows_loaded: int) -> bool:
     logger.info(f"Refreshing materialized view {view_name} after loading {rows_loaded} rows")
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute(f"REFRESH MATERIALIZED VIEW {view_name}")
-        conn.commit()
-        logger.info(f"Materialized view {view_name} refreshed")
-        return True
-    except Exception as e:
-        logger.error(f"Refresh failed: {str(e)}")
-        conn.rollback()
-        raise
-    finally:
-        cursor.close()
-        conn.close()
+    with db_conn() as conn:
+        cursor = conn.cursor()
+        try:
+            # CONCURRENTLY rebuilds beside the live view (readers are never blocked) but needs a unique index
+            # and an already populated view, so the first refresh after the schema is created is a plain one
+            cursor.execute("SELECT ispopulated FROM pg_matviews WHERE matviewname = %s", (view_name,))
+            view = cursor.fetchone()
+            if view is None:
+                raise ValueError(f"Materialized view {view_name} does not exist; apply database-schema.sql "
+                                 f"to databases created from an older schema")
+            concurrently = "CONCURRENTLY " if view[0] else ""
+            cursor.execute(f"REFRESH MATERIALIZED VIEW {concurrently}{view_name}")
+            # Tell the API to drop its cached analytics results (delivered on commit)
+            cursor.execute("NOTIFY etl_loaded")
+            conn.commit()
+            logger.info(f"Materialized view {view_name} refreshed")
+            return True
+        except Exception as e:
+            logger.error(f"Refresh failed: {str(e)}")
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
 
 
 # Flyte workflow to orchestrate ETL
@@ -230,72 +284,87 @@ def refresh_materialized_view(view_name: str, rows_loaded: int) -> bool:
 def etl_workflow():
     data_configs = [
         {"file_path": "ecommerce_data/sample_product_categories.csv", "table_name": "product_categories",
-         "columns": ["category_id", "name", "description", "created_at"]},
+         "columns": ["category_id", "name", "description", "created_at"],
+         "not_null_cols": ["category_id", "name", "created_at"]},
         {"file_path": "ecommerce_data/sample_products.csv", "table_name": "products",
          "columns": ["product_id", "name", "description", "price", "cost", "category_id", "sku", "inventory_count",
-                     "weight", "created_at", "is_active"]},
+                     "weight", "created_at", "is_active"],
+         "not_null_cols": ["product_id", "name", "price", "category_id", "sku", "inventory_count", "created_at",
+                           "is_active"]},
         {"file_path": "ecommerce_data/sample_customers.csv", "table_name": "customers",
          "columns": ["customer_id", "email", "first_name", "last_name", "street_address", "city", "state", "zip_code",
-                     "country", "phone", "registration_date", "last_login", "lifetime_value"]},
+                     "country", "phone", "registration_date", "last_login"],
+         "not_null_cols": ["customer_id", "email", "first_name", "last_name", "registration_date"]},
         {"file_path": "ecommerce_data/sample_orders.csv", "table_name": "orders",
          "columns": ["order_id", "customer_id", "order_date", "status", "payment_method", "shipping_address",
                      "shipping_city", "shipping_state", "shipping_zip", "shipping_country", "processing_date",
-                     "shipping_date", "delivery_date", "total_amount"]},
+                     "shipping_date", "delivery_date", "total_amount"],
+         "not_null_cols": ["order_id", "customer_id", "order_date", "status", "payment_method", "shipping_address",
+                           "shipping_city", "shipping_state", "shipping_zip", "shipping_country", "total_amount"]},
         {"file_path": "ecommerce_data/sample_order_items.csv", "table_name": "order_items",
-         "columns": ["order_item_id", "order_id", "product_id", "quantity", "price", "discount", "total"]}
+         "columns": ["order_item_id", "order_id", "product_id", "quantity", "price", "discount", "total"],
+         "not_null_cols": ["order_item_id", "order_id", "product_id", "quantity", "price", "discount", "total"],
+         # Numeric columns feed the total calculation
+         "dtype": {"order_item_id": "int32", "order_id": "int32", "product_id": "int32", "quantity": "int32",
+                   "price": "double", "discount": "double", "total": "double"}}
     ]
 
-    # Populate dim_time (run first as it’s independent)
+    # Only foreign key edges order the loads (declared with >> where no data flows between the tasks),
+    # so Flyte runs the independent branches concurrently: dim_time, product_categories -> products ->
+    # order_items, and customers -> orders
+    # Populate dim_time (independent of every other table)
     dim_time_rows_loaded = populate_dim_time(start_date="2021-01-01", end_date="2025-12-31")
 
-    # Extract all data
-    extracted_data = {config["table_name"]: extract_csv(file_path=config["file_path"]) for config in data_configs}
-
-    # Concatenate chunks
-    cat_df = concatenate_chunks(chunks=extracted_data["product_categories"])
-    prod_df = concatenate_chunks(chunks=extracted_data["products"])
-    cust_df = concatenate_chunks(chunks=extracted_data["customers"])
-    ord_df = concatenate_chunks(chunks=extracted_data["orders"])
-    oi_df = concatenate_chunks(chunks=extracted_data["order_items"])
-
-    # Transform and load product_categories
-    cat_transformed = transform_data(df=cat_df, table_name="product_categories", columns=data_configs[0]["columns"])
-    cat_rows_loaded = load_to_db(table_name="product_categories", columns=data_configs[0]["columns"],
-                                 data_rows=cat_transformed)
-
-    # Transform and load products (depends on product_categories)
-    prod_transformed = transform_data(df=prod_df, table_name="products", columns=data_configs[1]["columns"])
-    prod_rows_loaded = load_to_db(table_name="products", columns=data_configs[1]["columns"],
-                                  data_rows=prod_transformed)
-
-    # Transform and load customers (must be before orders due to FK)
-    cust_transformed = transform_data(df=cust_df, table_name="customers", columns=data_configs[2]["columns"],
-                                      orders_df=ord_df)
-    cust_rows_loaded = load_to_db(table_name="customers", columns=data_configs[2]["columns"],
-                                  data_rows=cust_transformed)
-
-    # Transform and load orders (depends on customers)
-    ord_transformed = transform_data(df=ord_df, table_name="orders", columns=data_configs[3]["columns"])
-    ord_rows_loaded = load_to_db(table_name="orders", columns=data_configs[3]["columns"],
-                                 data_rows=ord_transformed)
-
-    # Transform and load order_items (depends on orders and products)
-    oi_transformed = transform_data(df=oi_df, table_name="order_items", columns=data_configs[4]["columns"])
-    oi_rows_loaded = load_to_db(table_name="order_items", columns=data_configs[4]["columns"],
-                                data_rows=oi_transformed)
+    # Load product_categories
+    cat_rows_loaded = stream_etl(file_path=data_configs[0]["file_path"], table_name="product_categories",
+                                 columns=data_configs[0]["columns"],
+                                 not_null_cols=data_configs[0]["not_null_cols"])
+
+    # Load products (depends on product_categories)
+    prod_rows_loaded = stream_etl(file_path=data_configs[1]["file_path"], table_name="products",
+                                  columns=data_configs[1]["columns"],
+                                  not_null_cols=data_configs[1]["not_null_cols"])
+    cat_rows_loaded >> prod_rows_loaded
+
+    # Load customers (must be before orders due to FK; lifetime_value is filled in once orders are loaded)
+    cust_rows_loaded = stream_etl(file_path=data_configs[2]["file_path"], table_name="customers",
+                                  columns=data_configs[2]["columns"],
+                                  not_null_cols=data_configs[2]["not_null_cols"])
+
+    # Load orders (depends on customers)
+    ord_rows_loaded = stream_etl(file_path=data_configs[3]["file_path"], table_name="orders",
+                                 columns=data_configs[3]["columns"],
+                                 not_null_cols=data_configs[3]["not_null_cols"])
+    cust_rows_loaded >> ord_rows_loaded
+
+    # Customer lifetime values (depends on customers and orders)
+    ltv_rows_updated = update_customer_ltv(customers_loaded=cust_rows_loaded, orders_loaded=ord_rows_loaded)
+
+    # Transform and load order_items (depends on products; order_id carries no FK since orders is
+    # partitioned, so it loads alongside the customers -> orders branch)
+    oi_rows_loaded = stream_etl(file_path=data_configs[4]["file_path"], table_name="order_items",
+                                columns=data_configs[4]["columns"], not_null_cols=data_configs[4]["not_null_cols"],
+                                dtype=data_configs[4]["dtype"])
+    prod_rows_loaded >> oi_rows_loaded
 
     # Aggregate daily sales (depends on order_items, products, and orders)
-    daily_agg = aggregate_daily_sales(order_items_df=oi_df, products_df=prod_df, orders_df=ord_df)
-    daily_rows_loaded = load_to_db(table_name="daily_sales_aggregation",
-                                   columns=["date", "product_id", "category_id", "units_sold", "revenue", "order_count",
-                                            "avg_unit_price"],
-                                   data_rows=daily_agg)
+    daily_rows_loaded = aggregate_daily_sales_sql(order_items_loaded=oi_rows_loaded, orders_loaded=ord_rows_loaded)
 
-    # Refresh materialized view
+    # Refresh materialized views (they read orders as well as order_items)
     refresh_success = refresh_materialized_view(view_name="product_sales_summary", rows_loaded=oi_rows_loaded)
+    category_sales_refreshed = refresh_materialized_view(view_name="product_category_sales_mv",
+                                                         rows_loaded=oi_rows_loaded)
+    ord_rows_loaded >> refresh_success
+    ord_rows_loaded >> category_sales_refreshed
 
 
 # Unit Tests
+@pytest.fixture(autouse=True)
+def fresh_db_pool(mocker):
+    # Each test builds its own pool, so a mocked psycopg2.connect is never shadowed by an earlier test's
+    mocker.patch(f"{__name__}._db_pool", None)
+
+
 @pytest.fixture
 def sample_df():
     return pd.DataFrame({
@@ -306,21 +375,11 @@ def sample_df():
     })
 
 
-def test_extract_csv(tmp_path):
-    file = tmp_path / "test.csv"
-    df = pd.DataFrame({"col1": [1, 2], "col2": ["a", "b"]})
-    df.to_csv(file, index=False)
-    result = extract_csv(file_path=str(file))
-    assert len(result) == 1
-    pd.testing.assert_frame_equal(result[0], df)
-
-
 def test_transform_data_products(sample_df):
     columns = ["product_id", "name", "description", "price", "cost", "category_id", "sku",
                "inventory_count", "weight", "created_at", "is_active"]
     result = transform_data(df=sample_df, table_name="products", columns=columns)
-    expected = [list(row) for row in sample_df[columns].astype(str).values]
-    assert result == expected
+    pd.testing.assert_frame_equal(result, sample_df[columns])
 
 
 def test_transform_data_order_items():
@@ -328,34 +387,76 @@ def test_transform_data_order_items():
                        "quantity": [2], "price": [10.0], "discount": [1.0], "total": [0.0]})
     columns = ["order_item_id", "order_id", "product_id", "quantity", "price", "discount", "total"]
     result = transform_data(df=df, table_name="order_items", columns=columns)
-    expected = [["1", "1", "1", "2", "10.0", "1.0", "19.0"]]  # (10 * 2) - 1 = 19
-    assert result == expected
+    expected = [(1, 1, 1, 2, 10.0, 1.0, 19.0)]  # (10 * 2) - 1 = 19
+    assert list(result.itertuples(index=False, name=None)) == expected
 
 
-def test_load_to_db(mocker):
+def test_transform_data_not_null_cols():
+    df = pd.DataFrame({"customer_id": [1, 2, 3], "email": ["a@x.com", "b@x.com", None], "phone": [None, "555", "556"]})
+    columns = ["customer_id", "email", "phone"]
+    result = transform_data(df=df, table_name="customers", columns=columns, not_null_cols=["customer_id", "email"])
+    # Missing optional phone is kept, missing required email is dropped
+    assert result["customer_id"].tolist() == [1, 2]
+
+
+def test_update_customer_ltv(mocker):
     mocker.patch("psycopg2.connect", return_value=mocker.Mock())
     conn = psycopg2.connect()
     cursor = conn.cursor.return_value
-    data_rows = [["1", "test"], ["2", "test2"]]
-    columns = ["id", "name"]
-    result = load_to_db(table_name="test_table", columns=columns, data_rows=data_rows)
-    assert result == 2
+    cursor.rowcount = 3
+    result = update_customer_ltv(customers_loaded=3, orders_loaded=5)
+    assert result == 3
     cursor.execute.assert_called_once()
 
 
+def test_stream_etl(mocker, tmp_path):
+    mocker.patch("psycopg2.connect", return_value=mocker.Mock())
+    conn = psycopg2.connect()
+    cursor = conn.cursor.return_value
+    file = tmp_path / "test.csv"
+    pd.DataFrame({"id": [1, 2, 3], "name": ["test", "test2", None], "extra": ["x", "y", "z"]}).to_csv(file, index=False)
+    result = stream_etl(file_path=str(file), table_name="test_table", columns=["id", "name"], block_size=24)
+    assert result == 2  # Row missing name dropped
+    assert cursor.copy_expert.call_count > 1  # One COPY per block
+    conn.commit.assert_called_once()
+
+
+@pytest.mark.parametrize("ispopulated, refresh_sql", [
+    (False, "REFRESH MATERIALIZED VIEW product_sales_summary"),
+    (True, "REFRESH MATERIALIZED VIEW CONCURRENTLY product_sales_summary"),
+])
+def test_refresh_materialized_view(mocker, ispopulated, refresh_sql):
+    mocker.patch("psycopg2.connect", return_value=mocker.Mock())
+    conn = psycopg2.connect()
+    cursor = conn.cursor.return_value
+    cursor.fetchone.return_value = (ispopulated,)
+    assert refresh_materialized_view(view_name="product_sales_summary", rows_loaded=1)
+    executed = [call.args[0] for call in cursor.execute.call_args_list]
+    assert executed[1:] == [refresh_sql, "NOTIFY etl_loaded"]
+
+
+def test_refresh_materialized_view_missing(mocker):
+    mocker.patch("psycopg2.connect", return_value=mocker.Mock())
+    conn = psycopg2.connect()
+    cursor = conn.cursor.return_value
+    cursor.fetchone.return_value = None
+    with pytest.raises(ValueError, match="does not exist"):
+        refresh_materialized_view(view_name="product_category_sales_mv", rows_loaded=1)
+    conn.rollback.assert_called_once()
+
+
 def test_populate_dim_time(mocker):
     mocker.patch("psycopg2.connect", return_value=mocker.Mock())
     conn = psycopg2.connect()
     cursor = conn.cursor.return_value
     result = populate_dim_time(start_date="2023-01-01", end_date="2023-01-03")
     assert result == 3  # 3 days
-    cursor.execute.assert_called()
+    cursor.execute.assert_called_once()  # TRUNCATE
+    cursor.copy_expert.assert_called_once()
 
 
 if __name__ == "__main__":
     logger.info("Starting ETL workflow...")
     etl_workflow()
-    logger.info("ETL workflow completed. Keeping container alive...")
-    while True:
-        time.sleep(60)
-        logger.info("Workflow service is still alive...")
\ No newline at end of file
+    # Exit once the run is done; the container stops with it instead of idling
+    logger.info("ETL workflow completed")
\ No newline at end of file